@@ -1,9 +1,12 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import numpy as np
+from matplotlib.figure import Figure
 from datetime import datetime
+from pathlib import Path
 import re
+import os
+import tempfile
 
 # Set page configuration
 st.set_page_config(
@@ -40,89 +43,144 @@ with st.expander("About the Data Source", expanded=False):
     If a case is not shown in the dashboard, there is likely not a case filed no one has yet brought a federal lawsuit in their name and hasn't been spun off into its own complaint or appeal. Most of the challenges to the March 2025 deportation flights have been handled as a class action (e.g. J.G.G. v. Trump), with detainees identified by initials or put into an aggregated "class" rather than named individually. Unless the victim (or a legal aid organization on their behalf) files a distinct complaint or intervenes in the pending lawsuits, you won't see their name on the public dockets.
     """)
 
+# Parsed copy of the CSV, reused across app restarts while it is newer than the CSV
+CSV_PATH = Path("courtlistener_cases.csv")
+PARQUET_PATH = Path("courtlistener_cases.parquet")
+
+# Low-cardinality text columns are read as categories so filters and counts compare integer codes
+CASE_DTYPES = {
+    'case_name': 'string[pyarrow]',
+    'case_summary': 'string[pyarrow]',
+    'court': 'category',
+    'is_us_citizen': 'category',
+    'person_name': 'category',
+}
+BOOLEAN_COLUMNS = ['wrongful_deportation', 'wrongful_detention']
+
+def has_case_dtypes(df):
+    # A Parquet copy written by older code may hold the same columns with other dtypes
+    return (
+        all(col in df.columns and df[col].dtype == dtype for col, dtype in CASE_DTYPES.items())
+        and all(col in df.columns and df[col].dtype == 'boolean' for col in BOOLEAN_COLUMNS)
+        and 'date_filed' in df.columns
+        and pd.api.types.is_datetime64_any_dtype(df['date_filed'])
+    )
+
+def read_cases():
+    if PARQUET_PATH.exists() and PARQUET_PATH.stat().st_mtime >= CSV_PATH.stat().st_mtime:
+        try:
+            df = pd.read_parquet(PARQUET_PATH)
+        except (OSError, ValueError):
+            # A truncated or unreadable copy is rebuilt from the CSV below
+            df = None
+        if df is not None and has_case_dtypes(df):
+            return df
+    
+    df = pd.read_csv(CSV_PATH, engine='pyarrow', parse_dates=['date_filed'], dtype=CASE_DTYPES)
+    # Convert string to nullable boolean for filtering
+    for col in BOOLEAN_COLUMNS:
+        df[col] = df[col].map({'yes': True, 'no': False, 'unknown': None}).astype('boolean')
+    
+    # Write through a unique temporary file next to the target so a killed app never leaves a
+    # truncated copy that looks newer than the CSV
+    tmp_path = None
+    try:
+        with tempfile.NamedTemporaryFile(dir=PARQUET_PATH.parent, suffix='.tmp', delete=False) as tmp_file:
+            tmp_path = tmp_file.name
+            df.to_parquet(tmp_file, compression='zstd')
+        os.replace(tmp_path, PARQUET_PATH)
+    except OSError:
+        # Read-only deployments just parse the CSV on every cold start
+        if tmp_path is not None:
+            Path(tmp_path).unlink(missing_ok=True)
+    return df
+
 # Load data
 @st.cache_data
 def load_data():
-    df = pd.read_csv("courtlistener_cases.csv")
-    # Convert string to boolean for filtering
-    for col in ['wrongful_deportation', 'wrongful_detention']:
-        df[col] = df[col].map({'yes': True, 'no': False, 'unknown': None})
-    # Convert date string to datetime
-    df['date_filed'] = pd.to_datetime(df['date_filed'])
+    df = read_cases()
+    # Pre-format display strings once so the case details only read ready-made columns
+    df['date_str'] = df['date_filed'].dt.strftime('%Y-%m-%d')
+    summaries = df['case_summary'].fillna('')
+    df['summary_trunc'] = np.where(summaries.str.len() > 150, summaries.str.slice(0, 150) + '...', summaries)
+    df['citizen_str'] = df['is_us_citizen'].astype('string').fillna('unknown').str.capitalize()
+    df['has_url'] = df['url'].notna().to_numpy()
+    df['url_full'] = 'https://courtlistener.com' + df['url'].fillna('')
+    df['is_wrongful'] = (df['wrongful_deportation'].fillna(False) | df['wrongful_detention'].fillna(False)).to_numpy(dtype=bool)
+    df['has_named_person'] = df['person_name'].notna() & (df['person_name'].str.lower() != 'unknown')
     return df
 
 df = load_data()
 
+# Splits a case name like "A v. B" or "A v B" into its parties
+VERSUS_PATTERN = re.compile(r'\sv\.?\s')
+
 # Function to identify related cases
+@st.cache_data(show_spinner=False)
 def group_related_cases(cases_df):
     # Extract names from case titles
-    cases_df['case_parties'] = cases_df['case_name'].apply(lambda x: set(re.split(r'\sv\.\s|\sv\s', x)))
+    case_parties = [frozenset(VERSUS_PATTERN.split(name)) for name in cases_df['case_name'].to_numpy()]
     
-    # Create a dictionary to store case groups
-    case_groups = {}
-    group_id = 0
-    assigned_cases = set()
+    labels = np.full(len(cases_df), -1)
     
-    # Group by person_name (when available and not unknown)
-    for idx, row in cases_df.iterrows():
-        if idx in assigned_cases:
-            continue
-            
-        if pd.notna(row['person_name']) and row['person_name'].lower() != 'unknown':
-            # Find all cases with the same person
-            same_person = cases_df[cases_df['person_name'] == row['person_name']].index.tolist()
-            if len(same_person) > 1:
-                case_groups[group_id] = same_person
-                assigned_cases.update(same_person)
-                group_id += 1
+    # Group by person name first (when available and not unknown), numbering the groups in order
+    # of each name's first appearance
+    named_positions = np.flatnonzero(cases_df['has_named_person'].to_numpy())
+    name_codes, _ = pd.factorize(cases_df['person_name'].to_numpy()[named_positions])
+    is_shared_name = np.bincount(name_codes) > 1
+    name_group_ids = np.cumsum(is_shared_name) - 1
+    in_name_group = is_shared_name[name_codes]
+    labels[named_positions[in_name_group]] = name_group_ids[name_codes[in_name_group]]
+    group_id = int(is_shared_name.sum())
+    
+    # Inverted index from case party to row positions, so party matches are looked up instead of
+    # comparing every pair of cases
+    positions_by_party = {}
+    for pos, parties in enumerate(case_parties):
+        for party in parties:
+            positions_by_party.setdefault(party, []).append(pos)
     
-    # Group by case parties for remaining cases
-    for idx, row in cases_df.iterrows():
-        if idx in assigned_cases:
+    # Group each remaining case with the unassigned cases that share a party with it directly.
+    # Matches are not followed any further, so common parties like "United States" don't chain
+    # unrelated cases together.
+    for pos, parties in enumerate(case_parties):
+        if labels[pos] != -1:
             continue
-            
-        related_cases = [idx]
-        for idx2, row2 in cases_df.iterrows():
-            if idx != idx2 and idx2 not in assigned_cases:
-                # Check if case names share parties
-                if row['case_parties'] & row2['case_parties']:  # Set intersection
-                    related_cases.append(idx2)
-        
-        if len(related_cases) > 1:
-            case_groups[group_id] = related_cases
-            assigned_cases.update(related_cases)
+        matches = {other for party in parties for other in positions_by_party[party]}
+        related = [other for other in matches if labels[other] == -1]
+        if len(related) > 1:
+            labels[related] = group_id
             group_id += 1
     
+    # Cases not in any group get their own group ID
+    ungrouped = labels == -1
+    labels[ungrouped] = np.arange(group_id, group_id + ungrouped.sum())
+    
     # Create a new dataframe with group information
     result_df = cases_df.copy()
-    result_df['case_group'] = None
-    
-    for group_id, case_indices in case_groups.items():
-        result_df.loc[case_indices, 'case_group'] = group_id
-    
-    # Cases not in any group get their own group ID
-    ungrouped_cases = result_df[result_df['case_group'].isna()].index
-    for i, idx in enumerate(ungrouped_cases):
-        result_df.loc[idx, 'case_group'] = group_id + i
+    result_df['case_parties'] = case_parties
+    result_df['case_group'] = labels
     
     return result_df
 
 # Filter for wrongful deportation or detention cases
-wrongful_cases = df[(df['wrongful_deportation'] == True) | (df['wrongful_detention'] == True)]
+wrongful_cases = df[df['is_wrongful']]
 
 # Group related cases
 grouped_cases = group_related_cases(wrongful_cases)
 
+# Categories are already deduplicated, so no column scan is needed for the court list
+all_courts = sorted(df['court'].cat.categories.tolist())
+min_date = df['date_filed'].min().date()
+max_date = df['date_filed'].max().date()
+
 # Sidebar filters
 st.sidebar.header("Filters")
 
 # Court filter
-all_courts = sorted(df['court'].unique())
 selected_courts = st.sidebar.multiselect("Select Courts", all_courts, default=[])
 
 # Date range filter
-min_date = df['date_filed'].min().date()
-max_date = df['date_filed'].max().date()
 date_range = st.sidebar.date_input(
     "Date Range",
     value=(min_date, max_date),
@@ -134,27 +192,25 @@ date_range = st.sidebar.date_input(
 citizenship_options = ['All', 'US Citizen', 'Non-US Citizen', 'Unknown']
 citizenship_filter = st.sidebar.selectbox("Citizenship Status", citizenship_options)
 
-# Apply filters to get base filtered cases
-filtered_base = wrongful_cases.copy()
+# Apply filters as one combined mask so the cases are sliced only once
+CITIZENSHIP_CODES = {'US Citizen': 'yes', 'Non-US Citizen': 'no', 'Unknown': 'unknown'}
+mask = np.ones(len(wrongful_cases), dtype=bool)
 
 if selected_courts:
-    filtered_base = filtered_base[filtered_base['court'].isin(selected_courts)]
+    mask &= wrongful_cases['court'].isin(selected_courts).to_numpy()
 
 if len(date_range) == 2:
     start_date, end_date = date_range
-    filtered_base = filtered_base[(filtered_base['date_filed'].dt.date >= start_date) & 
-                                (filtered_base['date_filed'].dt.date <= end_date)]
+    filed_days = wrongful_cases['date_filed'].to_numpy().astype('datetime64[D]')
+    mask &= (filed_days >= np.datetime64(start_date)) & (filed_days <= np.datetime64(end_date))
 
 if citizenship_filter != 'All':
-    if citizenship_filter == 'US Citizen':
-        filtered_base = filtered_base[filtered_base['is_us_citizen'] == 'yes']
-    elif citizenship_filter == 'Non-US Citizen':
-        filtered_base = filtered_base[filtered_base['is_us_citizen'] == 'no']
-    elif citizenship_filter == 'Unknown':
-        filtered_base = filtered_base[filtered_base['is_us_citizen'] == 'unknown']
+    mask &= wrongful_cases['is_us_citizen'].to_numpy() == CITIZENSHIP_CODES[citizenship_filter]
+
+filtered_base = wrongful_cases[mask]
 
-# Get the filtered and grouped cases
-filtered_cases = group_related_cases(filtered_base)
+# Project the filters onto the grouping computed for all wrongful cases
+filtered_cases = grouped_cases[grouped_cases.index.isin(filtered_base.index)]
 
 # Dashboard metrics
 st.header("Case Statistics")
@@ -180,6 +236,15 @@ if filtered_cases.empty:
 else:
     # Group cases by case_group
     unique_groups = filtered_cases['case_group'].unique()
+    timeline_columns = ['date_str', 'case_name', 'court', 'docket_number', 'case_summary', 'summary_trunc', 'has_url', 'url_full']
+    
+    # Person named in the most recent case of each group that has one
+    group_person_names = (
+        filtered_cases[filtered_cases['has_named_person']]
+        .sort_values('date_filed', ascending=False)
+        .groupby('case_group')['person_name']
+        .first()
+    )
     
     for group in unique_groups:
         group_cases = filtered_cases[filtered_cases['case_group'] == group].sort_values('date_filed', ascending=False)
@@ -190,57 +255,55 @@ else:
             with st.expander(f"{case['case_name']} - {case['docket_number']} ({case['court']})"):
                 col1, col2 = st.columns([3, 1])
                 
+                # Each column's content is sent as a single markdown element
                 with col1:
-                    st.markdown(f"**Date Filed:** {case['date_filed'].date()}")
-                    st.markdown(f"**Person Name:** {case['person_name']}")
-                    st.markdown(f"**Case Title:** {case['case_title']}")
-                    st.markdown("**Case Summary:**")
-                    st.markdown(case['case_summary'])
+                    st.markdown("\n\n".join([
+                        f"**Date Filed:** {case['date_str']}",
+                        f"**Person Name:** {case['person_name']}",
+                        f"**Case Title:** {case['case_title']}",
+                        "**Case Summary:**",
+                        f"{case['case_summary']}",
+                    ]))
                     
                 with col2:
-                    st.markdown("**Case Details:**")
-                    st.markdown(f"- Wrongful Deportation: {'Yes' if case['wrongful_deportation'] else 'No'}")
-                    st.markdown(f"- Wrongful Detention: {'Yes' if case['wrongful_detention'] else 'No'}")
-                    st.markdown(f"- US Citizen: {case['is_us_citizen'].capitalize() if not pd.isna(case['is_us_citizen']) else 'Unknown'}")
-                    
-                    if pd.notna(case['url']):
-                        st.markdown(f"[View Full Case](https://courtlistener.com{case['url']})")
+                    details = [
+                        "**Case Details:**",
+                        f"- Wrongful Deportation: {'Yes' if pd.notna(case['wrongful_deportation']) and case['wrongful_deportation'] else 'No'}\n"
+                        f"- Wrongful Detention: {'Yes' if pd.notna(case['wrongful_detention']) and case['wrongful_detention'] else 'No'}\n"
+                        f"- US Citizen: {case['citizen_str']}",
+                    ]
+                    if case['has_url']:
+                        details.append(f"[View Full Case]({case['url_full']})")
+                    st.markdown("\n\n".join(details))
         else:
             # Multiple related cases
             # Use the most recent case name as the group title or the one with the person's name
-            named_cases = group_cases[pd.notna(group_cases['person_name']) & (group_cases['person_name'].str.lower() != 'unknown')]
-            if not named_cases.empty:
-                primary_case = named_cases.iloc[0]
-                person_name = primary_case['person_name']
-            else:
-                primary_case = group_cases.iloc[0]
-                person_name = "Unknown"
+            person_name = group_person_names.get(group, "Unknown")
             
             with st.expander(f"Case Group: {person_name} - {len(group_cases)} related cases"):
-                st.markdown(f"**Person Involved:** {person_name}")
+                # Build the whole group body first and send it as a single markdown element
+                chunks = [f"**Person Involved:** {person_name}"]
                 
                 # Show citizenship if consistent across cases
                 citizenship_values = group_cases['is_us_citizen'].unique()
                 if len(citizenship_values) == 1 and pd.notna(citizenship_values[0]):
-                    st.markdown(f"**US Citizen:** {citizenship_values[0].capitalize()}")
+                    chunks.append(f"**US Citizen:** {group_cases['citizen_str'].iat[0]}")
                 
                 # Case timeline
-                st.markdown("### Case Timeline")
-                for i, (_, case) in enumerate(group_cases.iterrows()):
-                    st.markdown(f"**{case['date_filed'].date()} - {case['case_name']} ({case['court']})**")
-                    st.markdown(f"Docket: {case['docket_number']}")
+                chunks.append("### Case Timeline")
+                for i, row in enumerate(group_cases[timeline_columns].itertuples(index=False, name=None)):
+                    date_str, case_name, court, docket_number, case_summary, summary_trunc, has_url, url_full = row
+                    chunks.append(f"**{date_str} - {case_name} ({court})**")
+                    chunks.append(f"Docket: {docket_number}")
                     
                     # Show full summary for the latest case (first in the list), truncate others
-                    if i == 0:
-                        st.markdown(f"Summary: {case['case_summary']}")
-                    else:
-                        summary = case['case_summary']
-                        truncated_summary = summary[:150] + "..." if len(summary) > 150 else summary
-                        st.markdown(f"Summary: {truncated_summary}")
+                    chunks.append(f"Summary: {case_summary if i == 0 else summary_trunc}")
                     
-                    if pd.notna(case['url']):
-                        st.markdown(f"[View Full Case](https://courtlistener.com{case['url']})")
-                    st.markdown("---")
+                    if has_url:
+                        chunks.append(f"[View Full Case]({url_full})")
+                    chunks.append("---")
+                
+                st.markdown("\n\n".join(chunks))
 
 # Visualizations
 st.header("Visualizations")
@@ -251,13 +314,18 @@ with viz_cols[0]:
     # Count by court
     if not filtered_cases.empty:
         st.subheader("Cases by Court")
-        court_counts = filtered_cases['court'].value_counts().reset_index()
-        court_counts.columns = ['Court', 'Count']
+        court_counts = filtered_cases['court'].value_counts()
+        court_counts = court_counts[court_counts > 0]
         
-        fig, ax = plt.subplots(figsize=(10, 6))
-        sns.barplot(data=court_counts, x='Count', y='Court', ax=ax)
-        ax.set_xlim(right=max(court_counts['Count']) * 1.1)  # Add consistent padding
-        plt.tight_layout()
+        # Figures built outside pyplot are not tracked in its global registry, so nothing leaks across reruns
+        fig = Figure(figsize=(10, 6))
+        ax = fig.subplots()
+        # Reverse so the most common court is drawn at the top
+        ax.barh(court_counts.index.to_numpy()[::-1], court_counts.to_numpy()[::-1])
+        ax.set_xlabel('Count')
+        ax.set_ylabel('Court')
+        ax.set_xlim(right=court_counts.max() * 1.1)  # Add consistent padding
+        fig.tight_layout()
         st.pyplot(fig)
     else:
         st.info("No data available with current filters")
@@ -266,19 +334,24 @@ with viz_cols[1]:
     # Timeline of cases
     if not filtered_cases.empty:
         st.subheader("Timeline of Cases")
-        fig, ax = plt.subplots(figsize=(10, 6))
+        fig = Figure(figsize=(10, 6))
+        ax = fig.subplots()
         
-        # Group by month for the timeline
-        filtered_cases['month'] = filtered_cases['date_filed'].dt.to_period('M')
-        timeline_data = filtered_cases.groupby('month').size().reset_index(name='count')
-        timeline_data['month_date'] = timeline_data['month'].dt.to_timestamp()
+        # Group by calendar month for the timeline
+        timeline_data = (
+            filtered_cases
+            .groupby(pd.Grouper(key='date_filed', freq='MS'))
+            .size()
+            .rename('count')
+            .reset_index()
+        )
         
-        ax.plot(timeline_data['month_date'], timeline_data['count'], marker='o')
+        ax.plot(timeline_data['date_filed'], timeline_data['count'], marker='o')
         ax.set_xlabel('Date')
         ax.set_ylabel('Number of Cases')
-        plt.xticks(rotation=45)
+        ax.tick_params(axis='x', labelrotation=45)
         ax.set_ylim(bottom=0, top=max(timeline_data['count']) * 1.1)  # Add consistent padding
-        plt.tight_layout()
+        fig.tight_layout()
         st.pyplot(fig)
     else:
         st.info("No data available with current filters")
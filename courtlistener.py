@@ -1,14 +1,23 @@
 import os
+import csv
+import tempfile
+import orjson
+import functools
+from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta
 import logging
 from dotenv import load_dotenv
-import instructor
 from anthropic import Anthropic
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from typing import Literal
 import pandas as pd
+from selectolax.lexbor import LexborHTMLParser
 import time
+import re
+from concurrent.futures import ThreadPoolExecutor
 # Load environment variables
 load_dotenv()
 
@@ -22,6 +31,68 @@ logger = logging.getLogger(__name__)
 courtlistener_api_key = os.getenv("COURTLISTENER_API_KEY")
 claude_api_key = os.getenv("CLAUDE_API_KEY")  
 
+CLAUDE_MODEL = "claude-3-5-sonnet-20240620"
+CASE_ANALYSIS_TOOL_NAME = "record_case"
+
+# Budget for the case text in each Claude prompt, measured in tokens rather than characters
+MAX_CASE_TEXT_TOKENS = 100_000
+
+# Shared Claude client, created once so its connection pool is reused across cases
+anthropic_client = Anthropic(api_key=claude_api_key, max_retries=3) if claude_api_key else None
+
+# Column order of courtlistener_cases.csv
+CSV_FIELDS = [
+    'case_name', 'docket_number', 'court', 'date_filed', 'url', 'case_title', 'person_name',
+    'wrongful_deportation', 'wrongful_detention', 'is_us_citizen', 'case_summary'
+]
+
+# Raw opinion JSON is cached here so re-runs do not download the same opinion again
+OPINION_CACHE_DIR = Path(".cl_cache") / "opinions"
+
+# Opinion fields that can hold the case text, most preferred first. Plain-text fields come
+# before html, which is much larger and has to be stripped
+CASE_TEXT_FIELDS = ('plain_text', 'text', 'opinion_text', 'html')
+
+# Runs of punctuation and whitespace, collapsed when comparing case names
+CASE_NAME_SEPARATORS = re.compile(r'[\W_]+')
+
+# CourtListener opinion search. requests encodes these parameters for the first page;
+# later pages follow the cursor URL returned in each response's 'next' field
+SEARCH_URL = "https://www.courtlistener.com/api/rest/v4/search/"
+SEARCH_PARAMS = {
+    'q': (
+        '("alien enemy act" OR "el salvador" OR "cecot" OR "terrorism confinement center") '
+        'AND (wrongful OR wrongfully OR unlawful OR unlawfully) '
+        'AND (deportation OR deported OR detention OR detained OR removal OR removed OR "habeas corpus" '
+        'OR "due process" OR "ICE" OR "Immigration and Customs Enforcement" OR "Department of Homeland Security" '
+        'OR "DHS" OR "Trump" OR "Noem" OR "DOJ" OR "Trump Administration")'
+    ),
+    'type': 'o',
+    'order_by': 'score desc',
+    'stat_Published': 'on',
+    'stat_Unpublished': 'on',
+    'stat_Errata': 'on',
+    'stat_Separate': 'on',
+    'stat_In-chambers': 'on',
+    'stat_Relating-to': 'on',
+    'stat_Unknown': 'on',
+}
+
+# Shared CourtListener session: keeps connections alive between calls and retries throttled
+# or failed requests with backoff (honouring Retry-After on 429 responses)
+session = requests.Session()
+session.headers.update({"Authorization": f"Token {courtlistener_api_key}"})
+session.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False
+    )
+))
+
 class CaseAnalysis(BaseModel):
     """Structured output for case analysis"""
     case_title: str = Field(description="The title of the court case")
@@ -34,6 +105,13 @@ class CaseAnalysis(BaseModel):
         description="Whether the person is a US citizen")
     case_summary: str = Field(description="A summary of the case and its key findings")
 
+# Claude tool whose input schema is CaseAnalysis; the JSON schema is generated once at import
+CASE_ANALYSIS_TOOL = {
+    "name": CASE_ANALYSIS_TOOL_NAME,
+    "description": "Record the structured analysis of a court case",
+    "input_schema": CaseAnalysis.model_json_schema()
+}
+
 def search_courtlistener(fetch_full_text=False, max_pages=None):
     """
     Search CourtListener API for recent immigration-related cases
@@ -46,12 +124,6 @@ def search_courtlistener(fetch_full_text=False, max_pages=None):
     cases = []
     
     try:
-        # CourtListener search
-       
-        headers = {
-            "Authorization": f"Token {courtlistener_api_key}"
-        }
-        
         # Verify we have the API key
         if not courtlistener_api_key:
             logger.error("CourtListener API key is missing. Set the COURTLISTENER_API_KEY environment variable.")
@@ -60,47 +132,48 @@ def search_courtlistener(fetch_full_text=False, max_pages=None):
         # Use March 15th instead of calculating days back
         date_filed_after = "03/15/2024"
         
-        # Use direct URL approach with all parameters encoded
-        base_url = f"https://www.courtlistener.com/api/rest/v4/search/?q=(%22alien%20enemy%20act%22%20OR%20%22el%20salvador%22%20OR%20%22cecot%22%20OR%20%22terrorism%20confinement%20center%22)%20AND%20(wrongful%20OR%20wrongfully%20OR%20unlawful%20OR%20unlawfully)%20AND%20(deportation%20OR%20deported%20OR%20detention%20OR%20detained%20OR%20removal%20OR%20removed%20OR%20%22habeas%20corpus%22%20OR%20%22due%20process%22%20OR%20%22ICE%22%20OR%20%22Immigration%20and%20Customs%20Enforcement%22%20OR%20%22Department%20of%20Homeland%20Security%22%20OR%20%22DHS%22%20OR%20%22Trump%22%20OR%20%22Noem%22%20OR%20%22DOJ%22%20OR%20%22Trump%20Administration%22)&type=o&order_by=score%20desc&stat_Published=on&stat_Unpublished=on&stat_Errata=on&stat_Separate=on&stat_In-chambers=on&stat_Relating-to=on&stat_Unknown=on&filed_after={date_filed_after}"
-        
-        # ("alien enemy act" OR "el salvador" OR "cecot" OR "terrorism confinement center") AND (wrongful OR wrongfully OR unlawful OR unlawfully) AND (deportation OR deported OR detention OR detained OR removal OR removed OR "habeas corpus" OR "due process" OR "ICE" OR "Immigration and Customs Enforcement" OR "Department of Homeland Security" OR "DHS" OR "Trump" OR "Noem" OR "DOJ" OR "Trump Administration")
-
-        # Add pagination parameters
-        logger.info(f"Making initial request to: {base_url}")
-        logger.info(f"Using authorization header: Token {courtlistener_api_key[:4]}...")
+        search_params = {**SEARCH_PARAMS, 'filed_after': date_filed_after}
+        logger.info("Making initial request to: %s with query: %s", SEARCH_URL, search_params['q'])
+        logger.info("Using authorization header: Token %s...", courtlistener_api_key[:4])
         
-        next_url = base_url
+        # Only the first request carries the query; 'next' links already include it with the cursor
+        next_url = SEARCH_URL
+        params = search_params
         page_num = 1
         
-        # Continue fetching while there are more pages
+        # Continue fetching while there are more pages. The v4 search API paginates with an
+        # opaque cursor, so each page URL is only known from the previous page's 'next' link.
         while next_url:
-            logger.info(f"Fetching page {page_num} from: {next_url}")
-            response = requests.get(next_url, headers=headers)
+            logger.info("Fetching page %d from: %s", page_num, next_url)
+            response = session.get(next_url, params=params)
+            params = None
             
             if response.status_code == 200:
-                results = response.json()
+                results = orjson.loads(response.content)
                 # Log the page results
-                logger.info(f"Page {page_num} returned {len(results.get('results', []))} results")
+                if page_num == 1:
+                    logger.info("Search matched %s cases", results.get('count'))
+                logger.info("Page %d returned %d results", page_num, len(results.get('results', [])))
                 
                 # Process cases from this page
                 for i, case in enumerate(results.get('results', [])):
                     # Log the complete case entry
-                    logger.info(f"Case {i+1} on page {page_num} details:")
-                    logger.info(f"  Case Name: {case.get('caseName')}")
+                    logger.info("Case %d on page %d details:", i + 1, page_num)
+                    logger.info("  Case Name: %s", case.get('caseName'))
                     
                     # Get the correct opinion ID from the opinions array
-                    opinion_id = None
-                    if case.get('opinions') and len(case.get('opinions')) > 0:
-                        opinion_id = case['opinions'][0].get('id')
-                        logger.info(f"  Opinion ID from opinions array: {opinion_id}")
+                    opinions = case.get('opinions') or ()
+                    opinion_id = opinions[0].get('id') if opinions else None
+                    if opinion_id:
+                        logger.info("  Opinion ID from opinions array: %s", opinion_id)
                     
                     # Fallback to cluster_id if no opinion ID is found
                     cluster_id = case.get('cluster_id')
-                    # logger.info(f"  Cluster ID: {cluster_id}")
+                    # logger.info("  Cluster ID: %s", cluster_id)
                     
                     # Choose the most reliable ID
                     case_id = opinion_id or cluster_id
-                    logger.info(f"  Using ID: {case_id}")
+                    logger.info("  Using ID: %s", case_id)
                     
                     case_data = {
                         'case_name': case.get('caseName'),
@@ -111,11 +184,6 @@ def search_courtlistener(fetch_full_text=False, max_pages=None):
                         'case_id': case_id,  # Store the correct opinion ID
                         'text': ''
                     }
-                    
-                    # Fetch full text if requested
-                    if fetch_full_text and case_id:
-                        case_data['text'] = get_case_text(case_id, headers, case.get('caseName', ''))
-                        
                     cases.append(case_data)
                 
                 # Check if there are more pages
@@ -124,135 +192,377 @@ def search_courtlistener(fetch_full_text=False, max_pages=None):
                     page_num += 1
                     # Check if we've reached the maximum number of pages
                     if max_pages and page_num > max_pages:
-                        logger.info(f"Reached maximum number of pages ({max_pages})")
+                        logger.info("Reached maximum number of pages (%s)", max_pages)
                         break
-                    # Add a small delay to avoid rate limiting
-                    time.sleep(1)
                 else:
-                    logger.info(f"No more pages to fetch")
+                    logger.info("No more pages to fetch")
                     break
             else:
-                logger.error(f"Request failed with status: {response.status_code}")
-                logger.error(f"Response content: {response.text[:500]}")  # First 500 chars
+                logger.error("Request failed with status: %s", response.status_code)
+                logger.error("Response content: %s", response.text[:500])  # First 500 chars
                 break
         
-        logger.info(f"Found a total of {len(cases)} court cases across {page_num} pages")
+        # Fetch full text if requested, once all pages are collected
+        if fetch_full_text:
+            fetch_all_texts(cases)
+        
+        logger.info("Found a total of %d court cases across %d pages", len(cases), page_num)
         return cases
     except Exception as e:
-        logger.error(f"Error searching court cases: {str(e)}")
+        logger.error("Error searching court cases: %s", e)
         return []
 
-def get_case_text(case_id, headers, case_name):
+@functools.lru_cache(maxsize=4096)
+def fetch_opinion(case_id):
+    """
+    Fetch an opinion from CourtListener API, reusing the on-disk cache when available
+    
+    Args:
+        case_id (str): ID of the opinion in CourtListener
+    
+    Returns:
+        dict: Full opinion JSON
+    
+    Raises:
+        requests.HTTPError: If the request failed. Raising keeps the failure out of the cache
+    """
+    cache_path = OPINION_CACHE_DIR / f"{case_id}.json"
+    if cache_path.exists():
+        logger.info("Using cached opinion %s from: %s", case_id, cache_path)
+        return orjson.loads(cache_path.read_bytes())
+    
+    # Use the case ID directly to fetch the opinion
+    api_url = f"https://www.courtlistener.com/api/rest/v4/opinions/{case_id}/"
+    logger.info("Fetching opinion %s from: %s", case_id, api_url)
+    
+    response = session.get(api_url)
+    if response.status_code != 200:
+        logger.warning("Failed to fetch opinion %s: Status %s", case_id, response.status_code)
+        logger.warning("Response content: %s", response.text[:500])
+        raise requests.HTTPError(f"Status {response.status_code} fetching opinion {case_id}", response=response)
+    
+    case_data = orjson.loads(response.content)
+    
+    # Write through a unique temporary file so an interrupted run never leaves a truncated cache
+    # entry and threads fetching the same opinion don't share a temp file
+    OPINION_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=OPINION_CACHE_DIR, suffix='.tmp', delete=False) as tmp_file:
+        tmp_file.write(response.content)
+    os.replace(tmp_file.name, cache_path)
+    return case_data
+
+def html_to_text(html):
+    """
+    Convert an opinion's HTML into plain text so tags and styling don't reach Claude
+    
+    Args:
+        html (str): Raw HTML of the opinion
+    
+    Returns:
+        str: Text content of the HTML
+    """
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(['script', 'style'])
+    node = tree.body or tree.root
+    return node.text(separator=' ') if node is not None else ''
+
+def normalize_case_name(name):
+    """
+    Normalize a case name for comparison, ignoring case and punctuation
+    
+    Args:
+        name (str): Case name as written by CourtListener or the search results
+    
+    Returns:
+        str: Case-folded name with punctuation and whitespace runs collapsed to single spaces
+    """
+    return CASE_NAME_SEPARATORS.sub(' ', name.casefold()).strip()
+
+def get_case_text(case_id, case_name):
     """
     Fetch the full text of a case from CourtListener API
     
     Args:
         case_id (str): ID of the case in CourtListener
-        headers (dict): Headers for API request
         case_name (str): Name of the case for verification
     
     Returns:
         str: Full text of the case or empty string if error
     """
     try:
-        # Use the case ID directly to fetch the opinion
-        api_url = f"https://www.courtlistener.com/api/rest/v4/opinions/{case_id}/"
-        
-        logger.info(f"Fetching case text for '{case_name}' from: {api_url}")
+        logger.info("Fetching case text for '%s' (opinion %s)", case_name, case_id)
         
-        response = requests.get(api_url, headers=headers)
-        if response.status_code == 200:
-            case_data = response.json()
-            
+        try:
+            case_data = fetch_opinion(case_id)
+        except requests.HTTPError:
+            case_data = None
+        if case_data is not None:
             # Verify case identity to ensure we have the right text
             api_case_name = case_data.get('case_name', '')
-            if api_case_name and not api_case_name.lower() in case_name.lower() and not case_name.lower() in api_case_name.lower():
-                logger.warning(f"Case name mismatch! Expected: '{case_name}' but API returned: '{api_case_name}'")
-                logger.warning(f"Continuing anyway as ID-based retrieval should be reliable")
+            api_norm = normalize_case_name(api_case_name) if api_case_name else ''
+            expected_norm = normalize_case_name(case_name)
+            if api_norm and api_norm not in expected_norm and expected_norm not in api_norm:
+                logger.warning("Case name mismatch! Expected: '%s' but API returned: '%s'", case_name, api_case_name)
+                logger.warning("Continuing anyway as ID-based retrieval should be reliable")
             
             # Log the available keys to help debug
-            # logger.info(f"Available fields in response: {list(case_data.keys())}")
+            # logger.info("Available fields in response: %s", list(case_data.keys()))
             
-            # Try different possible fields for the text content
-            if 'html' in case_data and case_data['html']:
-                logger.info(f"Using 'html' field for case text of {case_name}")
-                return case_data['html']
-            elif 'plain_text' in case_data and case_data['plain_text']:
-                # logger.info(f"Using 'plain_text' field for case text of {case_name}")
-                return case_data['plain_text']
-            elif 'text' in case_data and case_data['text']:
-                logger.info(f"Using 'text' field for case text of {case_name}")
-                return case_data['text']
-            elif 'opinion_text' in case_data and case_data['opinion_text']:
-                logger.info(f"Using 'opinion_text' field for case text of {case_name}")
-                return case_data['opinion_text']
-            else:
-                # If no text field is found, log a sample of the response
-                logger.warning(f"No text field found for '{case_name}'. Sample data: {str(case_data)[:500]}")
-                return ''
+            # Try the possible text fields in order of preference
+            for field in CASE_TEXT_FIELDS:
+                value = case_data.get(field)
+                if value:
+                    logger.info("Using '%s' field for case text of %s", field, case_name)
+                    return html_to_text(value) if field == 'html' else value
+            
+            # If no text field is found, log a sample of the response; building it means
+            # converting the whole opinion to a string, so skip that when warnings are off
+            if logger.isEnabledFor(logging.WARNING):
+                logger.warning("No text field found for '%s'. Sample data: %s", case_name, str(case_data)[:500])
+            return ''
         else:
-            logger.warning(f"Failed to fetch case text for '{case_name}': Status {response.status_code}")
-            logger.warning(f"Response content: {response.text[:500]}")
+            logger.warning("Failed to fetch case text for '%s'", case_name)
             return ''
     except Exception as e:
-        logger.error(f"Error fetching case text for '{case_name}': {str(e)}")
+        logger.error("Error fetching case text for '%s': %s", case_name, e)
         return ''
 
-def analyze_case_with_claude(case_text, case_name):
+def fetch_all_texts(cases, max_workers=8):
     """
-    Analyze a case text using Claude 3.5 Sonnet with structured output
+    Fetch the full text of many cases concurrently
+    
+    Args:
+        cases (list): Case dicts from search_courtlistener; their 'text' field is filled in place
+        max_workers (int): Maximum number of opinions fetched at the same time
+    """
+    cases_with_id = [case for case in cases if case.get('case_id')]
+    logger.info("Fetching case text for %d cases with up to %d concurrent requests", len(cases_with_id), max_workers)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        texts = executor.map(
+            lambda case: get_case_text(case['case_id'], case.get('case_name') or ''),
+            cases_with_id
+        )
+        for case, text in zip(cases_with_id, texts):
+            case['text'] = text
+
+def truncate_case_text(case_text):
+    """
+    Trim a case text to roughly MAX_CASE_TEXT_TOKENS Claude tokens
     
     Args:
         case_text (str): The full text of the case
-        case_name (str): The name of the case for reference
         
     Returns:
-        CaseAnalysis: Structured analysis of the case
+        str: The case text, cut down to fit the token budget if needed
     """
+    # Every token covers at least one character, so shorter texts always fit without counting
+    if len(case_text) <= MAX_CASE_TEXT_TOKENS:
+        return case_text
+    
     try:
-        if not claude_api_key:
-            logger.error("Claude API key is missing. Set the CLAUDE_API_KEY environment variable.")
-            return None
-            
-        logger.info(f"Analyzing case: {case_name}")
-        
-        # Set up Claude client with instructor
-        client = Anthropic(api_key=claude_api_key)
-        instructor_client = instructor.from_anthropic(client)
+        token_count = anthropic_client.messages.count_tokens(
+            model=CLAUDE_MODEL,
+            messages=[{"role": "user", "content": case_text}]
+        ).input_tokens
+    except Exception as e:
+        logger.warning("Could not count case text tokens, truncating by characters: %s", e)
+        return case_text[:MAX_CASE_TEXT_TOKENS]
+    
+    if token_count <= MAX_CASE_TEXT_TOKENS:
+        return case_text
+    
+    # Keep the share of characters that matches the share of tokens within budget
+    logger.info("Truncating case text from %d tokens to about %d", token_count, MAX_CASE_TEXT_TOKENS)
+    return case_text[:len(case_text) * MAX_CASE_TEXT_TOKENS // token_count]
+
+def build_case_prompt(case_text, case_name):
+    """
+    Build the Claude prompt used to analyze a case
+    
+    Args:
+        case_text (str): The full text of the case
+        case_name (str): The name of the case for reference
         
-        # Create prompt for Claude
-        prompt = f"""
+    Returns:
+        str: Prompt asking Claude for the CaseAnalysis fields
+    """
+    return f"""
         You are a legal analyst specializing in immigration law. Please analyze the following court case 
         and extract key information about deportation or detention claims.
         
         Court Case: {case_name}
         
         Case Text:
-        {case_text[:100000]}  # Limiting to 100k tokens for Claude context window
+        {truncate_case_text(case_text)}
         
         Based on this case, please identify whether this involves wrongful deportation or detention,
         the name of the affected person, whether they are a US citizen, and provide a summary of the case.
         If any information is not explicitly stated or unclear, respond with "unknown".
         """
+
+def parse_case_analysis(message):
+    """
+    Validate the forced tool call in a Claude response as a CaseAnalysis
+    
+    Args:
+        message: Claude Messages API response
         
-        # Get structured response
-        response = instructor_client.chat.completions.create(
-            model="claude-3-5-sonnet-20240620",
-            response_model=CaseAnalysis,
+    Returns:
+        CaseAnalysis: Structured analysis of the case
+        
+    Raises:
+        ValidationError: If the response has no tool call or its input does not match CaseAnalysis
+    """
+    tool_input = next((block.input for block in message.content if block.type == "tool_use"), None)
+    return CaseAnalysis.model_validate(tool_input)
+
+def analyze_case_with_claude(case_text, case_name):
+    """
+    Analyze a case text using Claude 3.5 Sonnet with structured output
+    
+    Args:
+        case_text (str): The full text of the case
+        case_name (str): The name of the case for reference
+        
+    Returns:
+        CaseAnalysis: Structured analysis of the case
+    """
+    try:
+        if not claude_api_key:
+            logger.error("Claude API key is missing. Set the CLAUDE_API_KEY environment variable.")
+            return None
+            
+        logger.info("Analyzing case: %s", case_name)
+        
+        # Get structured response from a forced tool call
+        response = anthropic_client.messages.create(
+            model=CLAUDE_MODEL,
+            tools=[CASE_ANALYSIS_TOOL],
+            tool_choice={"type": "tool", "name": CASE_ANALYSIS_TOOL_NAME},
             messages=[
-                {"role": "user", "content": prompt}
+                {"role": "user", "content": build_case_prompt(case_text, case_name)}
             ],
             temperature=0.1,
             max_tokens=4000
         )
+        analysis = parse_case_analysis(response)
+        
+        logger.info("Successfully analyzed case: %s", case_name)
+        return analysis
+    
+    except Exception as e:
+        logger.error("Error analyzing case with Claude: %s", e)
+        return None
+
+def analyze_cases_with_claude_batch(cases, poll_interval=30, max_wait=4 * 60 * 60):
+    """
+    Analyze many cases in a single Claude Message Batches request with structured output
+    
+    Args:
+        cases (list): (case_text, case_name) tuples to analyze
+        poll_interval (int): Seconds to wait between batch status checks
+        max_wait (int): Seconds to wait for the batch to end before giving up on it
+        
+    Returns:
+        list: CaseAnalysis for each input case, in order, or None where the analysis failed.
+            None instead of a list if the batch itself could not be created or finished
+    """
+    analyses = [None] * len(cases)
+    if not cases:
+        return analyses
+    
+    try:
+        if not claude_api_key:
+            logger.error("Claude API key is missing. Set the CLAUDE_API_KEY environment variable.")
+            return None
+        
+        # Force a single tool call whose input schema is CaseAnalysis
+        batch_requests = [
+            {
+                "custom_id": f"case-{i}",
+                "params": {
+                    "model": CLAUDE_MODEL,
+                    "max_tokens": 4000,
+                    "temperature": 0.1,
+                    "tools": [CASE_ANALYSIS_TOOL],
+                    "tool_choice": {"type": "tool", "name": CASE_ANALYSIS_TOOL_NAME},
+                    "messages": [{"role": "user", "content": build_case_prompt(case_text, case_name)}]
+                }
+            }
+            for i, (case_text, case_name) in enumerate(cases)
+        ]
         
-        logger.info(f"Successfully analyzed case: {case_name}")
-        return response
+        batch = anthropic_client.messages.batches.create(requests=batch_requests)
+        logger.info("Submitted Claude batch %s with %d cases", batch.id, len(cases))
+        
+        deadline = time.monotonic() + max_wait
+        while batch.processing_status != "ended":
+            if time.monotonic() >= deadline:
+                logger.error("Claude batch %s did not end within %d seconds, cancelling it", batch.id, max_wait)
+                anthropic_client.messages.batches.cancel(batch.id)
+                return None
+            time.sleep(poll_interval)
+            batch = anthropic_client.messages.batches.retrieve(batch.id)
+            logger.info("Claude batch %s status: %s", batch.id, batch.processing_status)
+        
+        for result in anthropic_client.messages.batches.results(batch.id):
+            index = int(result.custom_id.split("-")[1])
+            case_name = cases[index][1]
+            if result.result.type != "succeeded":
+                logger.warning("Claude batch request for %s ended with: %s", case_name, result.result.type)
+                continue
+            
+            try:
+                analyses[index] = parse_case_analysis(result.result.message)
+                logger.info("Successfully analyzed case: %s", case_name)
+            except ValidationError as e:
+                logger.warning("Invalid analysis returned for %s: %s", case_name, e)
+        
+        return analyses
     
     except Exception as e:
-        logger.error(f"Error analyzing case with Claude: {str(e)}")
+        logger.error("Error analyzing cases with Claude batch: %s", e)
         return None
 
+def build_case_row(case, analysis):
+    """
+    Build the CSV row for a searched case and its Claude analysis
+    
+    Args:
+        case (dict): Case as returned by search_courtlistener
+        analysis (CaseAnalysis): Structured analysis of the case, or None if unavailable
+        
+    Returns:
+        dict: Row with a value for every column in CSV_FIELDS
+    """
+    case_data = {
+        'case_name': case['case_name'],
+        'docket_number': str(case['docket_number']),
+        'court': case.get('court', ''),
+        'date_filed': case.get('date_filed', ''),
+        'url': case['url']
+    }
+    
+    if analysis:
+        # Add analysis results to case data
+        case_data['case_title'] = analysis.case_title
+        case_data['person_name'] = analysis.person_name
+        case_data['wrongful_deportation'] = analysis.wrongful_deportation
+        case_data['wrongful_detention'] = analysis.wrongful_detention
+        case_data['is_us_citizen'] = analysis.is_us_citizen
+        case_data['case_summary'] = analysis.case_summary
+    else:
+        # Add empty values for analysis fields
+        case_data['case_title'] = ''
+        case_data['person_name'] = ''
+        case_data['wrongful_deportation'] = ''
+        case_data['wrongful_detention'] = ''
+        case_data['is_us_citizen'] = ''
+        case_data['case_summary'] = ''
+    
+    return case_data
+
 def load_existing_cases(csv_path='courtlistener_cases.csv'):
     """
     Load existing analyzed cases from CSV file
@@ -262,119 +572,113 @@ def load_existing_cases(csv_path='courtlistener_cases.csv'):
         
     Returns:
         set: Set of docket numbers that have already been processed
-        dict: Dictionary mapping docket numbers to their full data
     """
     existing_docket_numbers = set()
-    existing_cases_data = {}
     
     try:
         if os.path.exists(csv_path):
-            df = pd.read_csv(csv_path)
+            # Read docket numbers as text and keep blanks as '' so numeric-looking dockets
+            # aren't turned into floats like "12345.0" that never match the search results
+            df = pd.read_csv(csv_path, dtype={'docket_number': str}, keep_default_na=False)
             # Check if docket_number column exists
             if 'docket_number' not in df.columns:
                 logger.warning("No 'docket_number' column found in existing CSV. Cannot check for duplicates.")
-                return existing_docket_numbers, existing_cases_data
+                return existing_docket_numbers
                 
             # Create a set of existing docket numbers for quick lookup
-            existing_docket_numbers = set(df['docket_number'].dropna().astype(str))
+            existing_docket_numbers = {docket_number for docket_number in df['docket_number'] if docket_number}
             
-            # Create a dictionary for full case data lookup
-            for _, row in df.iterrows():
-                docket_number = str(row.get('docket_number', ''))
-                if docket_number:
-                    existing_cases_data[docket_number] = row.to_dict()
-            
-            logger.info(f"Loaded {len(existing_docket_numbers)} existing cases from {csv_path}")
+            logger.info("Loaded %d existing cases from %s", len(existing_docket_numbers), csv_path)
         else:
-            logger.info(f"No existing CSV file found at {csv_path}")
+            logger.info("No existing CSV file found at %s", csv_path)
     except Exception as e:
-        logger.error(f"Error loading existing cases: {str(e)}")
+        logger.error("Error loading existing cases: %s", e)
     
-    return existing_docket_numbers, existing_cases_data
+    return existing_docket_numbers
+
+def read_csv_header(csv_path='courtlistener_cases.csv'):
+    """
+    Read the column names from the header of an existing CSV file
+    
+    Args:
+        csv_path (str): Path to the CSV file
+        
+    Returns:
+        list: Column names in file order, or None if the file is missing or empty
+    """
+    if not os.path.exists(csv_path):
+        return None
+    with open(csv_path, newline='', encoding='utf-8') as csv_file:
+        return next(csv.reader(csv_file), None)
 
 if __name__ == "__main__":
     # Load existing cases to avoid duplicates
     csv_path = 'courtlistener_cases.csv'
-    existing_docket_numbers, existing_cases_data = load_existing_cases(csv_path)
     
-    # Set fetch_full_text=True to get the full text of each case
-    cases = search_courtlistener(fetch_full_text=False, max_pages=10)
+    # New rows are appended in CSV_FIELDS order, so stop before doing any work if the existing
+    # file's columns differ; otherwise values would silently land under the wrong columns
+    existing_header = read_csv_header(csv_path)
+    if existing_header is not None and existing_header != CSV_FIELDS:
+        logger.error("Columns of %s do not match the expected columns %s: %s", csv_path, CSV_FIELDS, existing_header)
+        raise SystemExit(1)
     
-    # Create a list to store analyzed cases
-    analyzed_cases = []
+    existing_docket_numbers = load_existing_cases(csv_path)
     
-    # Add existing cases to ensure we don't lose previous data
-    for docket_number, case_data in existing_cases_data.items():
-        analyzed_cases.append(case_data)
+    # Set fetch_full_text=True to get the full text of each case
+    cases = search_courtlistener(fetch_full_text=False, max_pages=10)
     
-    # Process new cases
+    # Collect the new cases first so their texts can be fetched and analyzed together
+    new_cases = []
     for case in cases:
         docket_number = str(case.get('docket_number', ''))
         
         # Skip if case already exists in our dataset
         if docket_number and docket_number in existing_docket_numbers:
-            logger.info(f"Skipping already processed case: {case['case_name']} (Docket: {docket_number})")
+            logger.info("Skipping already processed case: %s (Docket: %s)", case['case_name'], docket_number)
             continue
         
-        case_data = {
-            'case_name': case['case_name'],
-            'docket_number': docket_number,
-            'court': case.get('court', ''),
-            'date_filed': case.get('date_filed', ''),
-            'url': case['url']
-        }
-        
         # Only fetch full text for cases we haven't processed before
         if docket_number:
-            logger.info(f"Processing new case: {case['case_name']} (Docket: {docket_number})")
-            
-            # Fetch the full text only if needed
-            headers = {
-                "Authorization": f"Token {courtlistener_api_key}"
-            }
-            case_id = case.get('id', '')  # Get the API's case ID for fetching text
-            case_text = get_case_text(case_id, headers, case['case_name'])
-            
-            if case_text:
-                logger.info(f"Analyzing case: {case['case_name']}")
-                analysis = analyze_case_with_claude(case_text, case['case_name'])
+            logger.info("Processing new case: %s (Docket: %s)", case['case_name'], docket_number)
+            # Search results can list several opinions for one docket; only the first is analyzed
+            existing_docket_numbers.add(docket_number)
+            new_cases.append(case)
+    
+    # Fetch the full text only for the new cases
+    fetch_all_texts(new_cases)
+    cases_with_text = [case for case in new_cases if case['text']]
+    
+    # Append new cases to the CSV as soon as each row is final, so a crash keeps the work done so far.
+    # Existing rows are never rewritten.
+    write_header = existing_header is None
+    with open(csv_path, 'a', newline='', encoding='utf-8') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=CSV_FIELDS, lineterminator='\n')
+        if write_header:
+            writer.writeheader()
+        
+        # Cases without text cannot be analyzed, so their rows are already final
+        for case in new_cases:
+            if not case['text']:
+                logger.warning("No text available for case: %s", case['case_name'])
+                writer.writerow(build_case_row(case, None))
+                csv_file.flush()
+        
+        # Analyze every new case that has text in a single Claude batch
+        rows_written = len(new_cases) - len(cases_with_text)
+        analyses = analyze_cases_with_claude_batch([(case['text'], case['case_name']) for case in cases_with_text])
+        if analyses is None:
+            # Leave these cases out of the CSV so the next run picks them up again
+            logger.error("Claude batch failed; %d cases with text will be retried on the next run", len(cases_with_text))
+        else:
+            for case, analysis in zip(cases_with_text, analyses):
                 if analysis:
-                    # Add analysis results to case data
-                    case_data['case_title'] = analysis.case_title
-                    case_data['person_name'] = analysis.person_name
-                    case_data['wrongful_deportation'] = analysis.wrongful_deportation
-                    case_data['wrongful_detention'] = analysis.wrongful_detention
-                    case_data['is_us_citizen'] = analysis.is_us_citizen
-                    case_data['case_summary'] = analysis.case_summary
-                    logger.info(f"Successfully added analysis for: {case['case_name']}")
+                    logger.info("Successfully added analysis for: %s", case['case_name'])
                 else:
-                    # Add empty values for analysis fields
-                    case_data['case_title'] = ''
-                    case_data['person_name'] = ''
-                    case_data['wrongful_deportation'] = ''
-                    case_data['wrongful_detention'] = ''
-                    case_data['is_us_citizen'] = ''
-                    case_data['case_summary'] = ''
-                    logger.warning(f"Analysis failed for case: {case['case_name']}")
-            else:
-                # Add empty values for analysis fields
-                case_data['case_title'] = ''
-                case_data['person_name'] = ''
-                case_data['wrongful_deportation'] = ''
-                case_data['wrongful_detention'] = ''
-                case_data['is_us_citizen'] = ''
-                case_data['case_summary'] = ''
-                logger.warning(f"No text available for case: {case['case_name']}")
-            
-            analyzed_cases.append(case_data)
-            # wait 5 seconds
-            time.sleep(5)
-    
-    # Print the analyzed cases for debugging
-    new_cases_count = len(analyzed_cases) - len(existing_cases_data)
-    logger.info(f"Found {new_cases_count} new cases")
-    
-    # Save to CSV (all cases - both existing and new)
-    df = pd.DataFrame(analyzed_cases)
-    df.to_csv(csv_path, index=False)
-    logger.info(f"Saved {len(analyzed_cases)} cases to {csv_path}")
\ No newline at end of file
+                    logger.warning("Analysis failed for case: %s", case['case_name'])
+                writer.writerow(build_case_row(case, analysis))
+                csv_file.flush()
+            rows_written += len(cases_with_text)
+    
+    logger.info("Found %d new cases", len(new_cases))
+    logger.info("Appended %d cases to %s", rows_written, csv_path)
+    logger.info("Opinion cache stats: %s", fetch_opinion.cache_info())